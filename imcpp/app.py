@@ -33,7 +33,7 @@ def run_process(args):
         options.mcdpath = Path(options.mcdpath)
     else:
         options = load_config_file(mcd_or_yaml)
-    process(options)
+    process(options, resume=args.resume)
 
 
 def check_extension(choices):
@@ -68,6 +68,15 @@ def construct_parser():
         action=check_extension({".mcd", ".yaml"}),
         help="Path to .MCD or .YAML file for processing",
     )
+    processer.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help=(
+            "Resume an interrupted run from its checkpoints, skipping the "
+            "acquisitions and outputs it already finished"
+        ),
+    )
     processer.set_defaults(run_func=run_process)
 
     configer = subparsers.add_parser("config", parents=[parent])
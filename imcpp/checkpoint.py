@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+
+import numpy as np
+
+from .logger import logger
+
+
+def _remove(path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+@contextmanager
+def atomic_path(path):
+    # The temporary output keeps the final file name (writers such as the OME
+    # tiff writer embed it in their metadata) inside a hidden sibling folder,
+    # and is only moved into place once writing finished without error.
+    path = Path(path)
+    staging = path.with_name(f".{path.name}.partial")
+    _remove(staging)
+    staging.mkdir(parents=True)
+    tmp = staging / path.name
+    try:
+        yield tmp
+        _remove(path)
+        os.replace(tmp, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+class RunJournal:
+    def __init__(self, directory, fingerprint="", resume=False):
+        self.directory = Path(directory)
+        self.path = self.directory / "journal.jsonl"
+        self.fingerprint = fingerprint
+        self.completed = {}
+        self.stage = None
+        self.previous_stage = None
+        self.in_memory = {}
+
+        if resume:
+            self._load()
+        elif self.directory.exists():
+            logger.info(f"Discarding checkpoints of a previous run in {self.directory}")
+            shutil.rmtree(self.directory)
+
+        if not self.path.exists():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._append({"fingerprint": self.fingerprint})
+
+    def _load(self):
+        if not self.path.exists():
+            logger.info("No checkpoints found to resume from.  Starting from scratch.")
+            return
+
+        with open(self.path, "rb+") as fin:
+            entries, good = [], 0
+            for line in fin:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                good += len(line)
+            # drop a last line interrupted mid-write so that new entries are
+            # not appended onto the fragment
+            fin.truncate(good)
+
+        if not entries or entries[0].get("fingerprint") != self.fingerprint:
+            logger.warn(
+                f"Checkpoints in {self.directory} were made with different options. "
+                "Starting from scratch."
+            )
+            shutil.rmtree(self.directory)
+            return
+
+        for entry in entries[1:]:
+            self.completed[(entry["stage"], entry["acquisition"])] = entry
+        logger.info(f"Resuming with {len(self.completed)} completed steps.")
+
+    def _append(self, entry):
+        with open(self.path, "a") as fout:
+            fout.write(json.dumps(entry) + "\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def _checkpoint_path(self, stage, ac_id):
+        return self.directory / f"{stage}.a{ac_id}.npy"
+
+    def begin(self, stage):
+        self.previous_stage, self.stage = self.stage, stage
+
+    def is_done(self, stage, ac_id):
+        return (stage, str(ac_id)) in self.completed
+
+    def record(self, stage, ac_id, **extra):
+        entry = dict(stage=stage, acquisition=str(ac_id), **extra)
+        self._append(entry)
+        self.completed[(stage, str(ac_id))] = entry
+
+    def complete(self, mcd, ac_id, **extra):
+        with atomic_path(self._checkpoint_path(self.stage, ac_id)) as tmp:
+            with open(tmp, "wb") as fout:
+                np.save(fout, mcd.get_data(ac_id))
+        self.in_memory[ac_id] = self.stage
+        self.record(self.stage, ac_id, **extra)
+        # only the latest checkpoint of an acquisition is ever read back, and the
+        # previous stage's output was saved before this stage started
+        if self.previous_stage is not None:
+            _remove(self._checkpoint_path(self.previous_stage, ac_id))
+
+    def restore(self, mcd, ac_id, stage):
+        # bring the data of ac_id in mcd up to the output of `stage`; None is
+        # the raw data freshly loaded from the MCD
+        if self.in_memory.get(ac_id) == stage:
+            return
+        logger.info(f"Restoring acquisition {ac_id} from the {stage} checkpoint.")
+        mcd.set_data(np.load(self._checkpoint_path(stage, ac_id)), ac_id)
+        self.in_memory[ac_id] = stage
+
+    def finish(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def options_fingerprint(options):
+    return hashlib.sha1(repr(options).encode()).hexdigest()
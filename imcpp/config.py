@@ -78,21 +78,23 @@ class ProcessingOptions(yaml.YAMLObject):
 
     do_compensate: bool = True
     compensate_output_type: typing.Union[
-        None, typing.Literal["tiff", "tiffstack", "imc", "text"]
+        None, typing.Literal["tiff", "tiffstack", "imc", "text", "zarr"]
     ] = None
     compensate_output_suffix: typing.Union[None, str] = "-compensated"
     do_pixel_removal: bool = True
     pixel_removal_method: typing.Literal["conway", "tophat"] = "conway"
     pixel_removal_output_type: typing.Union[
-        None, typing.Literal["tiff", "tiffstack", "imc", "text"]
+        None, typing.Literal["tiff", "tiffstack", "imc", "text", "zarr"]
     ] = None
     pixel_removal_output_suffix: typing.Union[None, str] = "-cleaned"
     do_equalization: bool = True
     equalization_output_type: typing.Union[
-        None, typing.Literal["tiff", "tiffstack", "imc", "text"]
+        None, typing.Literal["tiff", "tiffstack", "imc", "text", "zarr"]
     ] = None
     equalization_output_suffix: typing.Union[None, str] = "-equalized"
     spillover_matrix_file: typing.Union[None, str] = None
+    qc_output_type: typing.Union[None, typing.Literal["csv", "parquet"]] = "csv"
+    qc_output_suffix: typing.Union[None, str] = "-qc"
 
     global_pixel_removal_neighbors: typing.Union[None, int] = None
     global_pixel_removal_selem: typing.Union[None, np.array] = None
@@ -104,7 +106,7 @@ class ProcessingOptions(yaml.YAMLObject):
             "compensation_output_type=%r, pixel_removal_output_type=%r, equalization_output_type=%r, "
             "compensation_output_suffix=%r, pixel_removal_output_suffix=%r, equalization_output_suffix=%r, "
             "pixel_removal_method=%r, global_pixel_removal_neighbors=%r, global_pixel_removal_selem=%r, "
-            "acquisitions=%r)"
+            "qc_output_type=%r, qc_output_suffix=%r, acquisitions=%r)"
         ) % (
             self.__class__.__name__,
             self.mcdpath,
@@ -122,6 +124,8 @@ class ProcessingOptions(yaml.YAMLObject):
             self.pixel_removal_method,
             self.global_pixel_removal_neighbors,
             self.global_pixel_removal_selem,
+            self.qc_output_type,
+            self.qc_output_suffix,
             self.acquisitions,
         )
 
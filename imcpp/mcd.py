@@ -2,15 +2,42 @@
 # -*- coding: utf-8 -*-
 
 from pathlib import Path
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
+from skimage.transform import downscale_local_mean
 from imctools.io.mcdparser import McdParser
 from imctools.io.abstractparserbase import AcquisitionError
-from imctools.io.imcfolderwriter import ImcFolderWriter
 from xml.etree import cElementTree as ElementTree
 
 from .logger import logger
+from .checkpoint import atomic_path
+
+ZARR_CHUNKS = (1, 512, 512)
+ZARR_MAX_LEVELS = 4
+# each IMC-folder writer holds a full channel stack of its acquisition
+IMC_WRITER_WORKERS = 2
+
+# output types whose writers import extra packages lazily
+OPTIONAL_OUTPUT_MODULES = {"zarr": ("zarr", "numcodecs")}
+
+
+def check_output_format(output_format):
+    missing = [
+        module
+        for module in OPTIONAL_OUTPUT_MODULES.get(output_format, ())
+        if find_spec(module) is None
+    ]
+    if missing:
+        msg = (
+            f"Output type [{output_format}] requires the missing package(s) "
+            f"{missing}.  Install them with "
+            f"`pip install imc-preprocessor[{output_format}]`."
+        )
+        logger.error(msg)
+        raise ImportError(msg)
 
 
 class MCD:
@@ -92,17 +119,34 @@ class MCD:
             assert len(new_data.shape) == 3
             imc_ac._data[offset:] = new_data
 
+    def _write_imc_acquisition(self, outpath, ac_id, channel_list):
+        imc_ac = self.acquisitions.get(ac_id)
+        # name files the way ImcFolderWriter does so ImcFolderParser can match
+        # each tiff back to its acquisition in the schema xml
+        metaname = self.mcd.meta.get_acquisitions()[ac_id].metaname
+        tiff = outpath / f"{metaname}_ac.ome.tiff"
+        metals = [metal for _, metal, _ in channel_list]
+        with atomic_path(tiff) as tmp:
+            iw = imc_ac.get_image_writer(filename=str(tmp), metals=metals)
+            iw.save_image(mode="ome", compression=0, dtype=None, bigtiff=False)
+        logger.debug(f"{tiff} saved.")
+
     def _write_imcfolder(self, acquisitions, prefix, suffix):
-        raise NotImplementedError("This is broken")
         logger.debug(f"Saving IMCfolder with prefix:[{prefix}] and suffix:[{suffix}]")
-        # TODO:This doesn't utilize acquisitions yet
         outpath = Path(prefix + suffix)
         if not outpath.exists():
             outpath.mkdir(exist_ok=True)
 
         self.mcd.save_meta_xml(str(outpath))
-        ifw = ImcFolderWriter(str(outpath), mcddata=self.mcd)
-        ifw.write_imc_folder()
+        # write the processed in-memory data directly rather than letting
+        # ImcFolderWriter re-read every acquisition from the MCD
+        with ThreadPoolExecutor(max_workers=IMC_WRITER_WORKERS) as pool:
+            futures = [
+                pool.submit(self._write_imc_acquisition, outpath, ac_id, channel_list)
+                for ac_id, channel_list in acquisitions.items()
+            ]
+            for future in futures:
+                future.result()
         logger.info(f"IMC-Folder written to {str(outpath)}")
 
     def _write_tiff(self, acquisitions, prefix, suffix):
@@ -120,8 +164,9 @@ class MCD:
             imc_ac = self.acquisitions.get(ac_id)
             for ch_id, metal, label in channel_list:
                 tiff = fmt.format(outpath, prefix, suffix, ac_id, metal, label)
-                iw = imc_ac.get_image_writer(filename=str(tiff), metals=[metal])
-                iw.save_image(mode="ome", compression=0, dtype=None, bigtiff=False)
+                with atomic_path(tiff) as tmp:
+                    iw = imc_ac.get_image_writer(filename=str(tmp), metals=[metal])
+                    iw.save_image(mode="ome", compression=0, dtype=None, bigtiff=False)
                 logger.debug(f"{tiff} saved.")
         logger.info(f"All tiffs saved.")
 
@@ -131,8 +176,9 @@ class MCD:
         for ac_id in acquisitions.keys():
             tiff = fmt.format(prefix, suffix, ac_id)
             imc_ac = self.acquisitions.get(ac_id)
-            iw = imc_ac.get_image_writer(filename=str(tiff))
-            iw.save_image(mode="ome", compression=0, dtype=None, bigtiff=False)
+            with atomic_path(tiff) as tmp:
+                iw = imc_ac.get_image_writer(filename=str(tmp))
+                iw.save_image(mode="ome", compression=0, dtype=None, bigtiff=False)
             logger.debug(f"{tiff} saved.")
         logger.info(f"All tiffstacks saved.")
 
@@ -163,16 +209,116 @@ class MCD:
             logger.debug(
                 f"Text data formatted. Saving {size//1024//1024}MB now. This may take a while..."
             )
-            data.to_csv(outfile, header=True, index=False, sep="\t")
+            with atomic_path(outfile) as tmp:
+                data.to_csv(tmp, header=True, index=False, sep="\t")
             logger.debug(f"{outfile} saved.")
         logger.info(f"All text files saved.")
 
+    @staticmethod
+    def _write_zarr_level(array, data):
+        # chunks map 1:1 onto files in the store, so concurrent writes to
+        # distinct chunks never touch the same file
+        cz, cy, cx = array.chunks
+        nz, ny, nx = data.shape
+        regions = [
+            (slice(z, z + cz), slice(y, y + cy), slice(x, x + cx))
+            for z in range(0, nz, cz)
+            for y in range(0, ny, cy)
+            for x in range(0, nx, cx)
+        ]
+
+        def write_chunk(region):
+            array[region] = data[region]
+
+        with ThreadPoolExecutor() as pool:
+            list(pool.map(write_chunk, regions))
+
+    def _write_zarr(self, acquisitions, prefix, suffix):
+        # zarr is only needed for this output type; keep the rest of the app
+        # usable in environments without it
+        import zarr
+        from numcodecs import Blosc
+
+        logger.debug(f"Saving zarr with prefix:[{prefix}] and suffix:[{suffix}]")
+        fmt = "{}{}.a{}.ome.zarr"
+        compressor = Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE)
+        for ac_id, channel_list in acquisitions.items():
+            outfile = fmt.format(prefix, suffix, ac_id)
+            ch_ids, ch_metals, ch_labels = map(list, zip(*channel_list))
+            data = np.ascontiguousarray(self.get_data(ac_id)[ch_ids])
+            maxima = data.reshape(data.shape[0], -1).max(axis=1)
+
+            with atomic_path(outfile) as tmp:
+                root = zarr.open_group(str(tmp), mode="w")
+                datasets = []
+                level = data
+                for k in range(ZARR_MAX_LEVELS):
+                    array = root.create_dataset(
+                        str(k),
+                        shape=level.shape,
+                        chunks=ZARR_CHUNKS,
+                        dtype=level.dtype,
+                        compressor=compressor,
+                    )
+                    self._write_zarr_level(array, level)
+                    datasets.append(
+                        {
+                            "path": str(k),
+                            "coordinateTransformations": [
+                                {"type": "scale", "scale": [1.0, 2.0 ** k, 2.0 ** k]}
+                            ],
+                        }
+                    )
+                    logger.debug(f"Level {k} of {outfile} written: {level.shape}.")
+                    if min(level.shape[1:]) // 2 < ZARR_CHUNKS[-1]:
+                        break
+                    level = downscale_local_mean(level, (1, 2, 2)).astype(data.dtype)
+
+                root.attrs["multiscales"] = [
+                    {
+                        "version": "0.4",
+                        "name": f"{prefix}{suffix}.a{ac_id}",
+                        "axes": [
+                            {"name": "c", "type": "channel"},
+                            {"name": "y", "type": "space"},
+                            {"name": "x", "type": "space"},
+                        ],
+                        "datasets": datasets,
+                    }
+                ]
+                root.attrs["omero"] = {
+                    "name": f"{prefix}{suffix}.a{ac_id}",
+                    "version": "0.4",
+                    "channels": [
+                        {
+                            "label": f"{metal}({label})",
+                            "active": True,
+                            "color": "FFFFFF",
+                            "window": {
+                                "start": 0.0,
+                                "end": float(m),
+                                "min": 0.0,
+                                "max": float(m),
+                            },
+                        }
+                        for metal, label, m in zip(ch_metals, ch_labels, maxima)
+                    ],
+                }
+                root.attrs["imcpp"] = {
+                    "acquisition_id": ac_id,
+                    "channel_metals": ch_metals,
+                    "channel_labels": ch_labels,
+                }
+            logger.debug(f"{outfile} saved.")
+        logger.info(f"All zarr stores saved.")
+
     def save(self, acquisitions, output_format, prefix="", suffix=""):
         save_funcs = {
             "imc": self._write_imcfolder,
             "tiff": self._write_tiff,
             "tiffstack": self._write_tiffstack,
             "text": self._write_text,
+            "zarr": self._write_zarr,
         }
         if not prefix:
             prefix = self.fileprefix
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .mcd import MCD
+from .mcd import MCD, check_output_format
 
 import numpy as np
 from argparse import Namespace
@@ -11,7 +11,9 @@ from skimage.morphology import square, disk, diamond
 from skimage.exposure import equalize_hist, equalize_adapthist
 
 from .logger import logger
-from .spillover import align_spillmat, load_spillmat
+from .checkpoint import RunJournal, options_fingerprint
+from .qc import QCCollector, SATURATION_VALUE
+from .spillover import align_spillmat, invert_spillmat, load_spillmat
 
 
 def cross(n):
@@ -44,12 +46,14 @@ def tophat(im, selem=square(2)):
     return im_
 
 
-def compensate(img_stack, spillmat):
+def compensate(img_stack, spillmat, inverse=None):
+    if inverse is None:
+        inverse = np.linalg.inv(spillmat.T)
     swapped = False
     if img_stack.shape[0] == spillmat.shape[0]:
         img_stack = np.moveaxis(img_stack, 0, 2)
         swapped = True
-    comp_ = img_stack @ np.linalg.inv(spillmat.T)
+    comp_ = img_stack @ inverse
     comp_ = np.round(np.clip(comp_, 0, comp_.max())).astype(np.uint16)
     if swapped:
         comp_ = np.moveaxis(comp_, 2, 0)
@@ -59,17 +63,6 @@ def compensate(img_stack, spillmat):
 def equalize(img_stack, adaptive=False):
     L = img_stack.shape[0]
 
-    logger.debug("5th and 95th percentile before equalization")
-    logger.debug(
-        np.column_stack(
-            (
-                np.arange(1, L + 1),
-                np.percentile(img_stack, 5, axis=(1, 2)),
-                np.percentile(img_stack, 95, axis=(1, 2)),
-            )
-        )
-    )
-
     if adaptive:
         equalized = np.array(
             [
@@ -87,22 +80,29 @@ def equalize(img_stack, adaptive=False):
 pixel_removal_functions = {"conway": conway, "tophat": tophat}
 
 
-def report_maxima(mcd, ac_options):
-    ac_id = ac_options.acquisition_id
-    for ch_opts in ac_options.channels:
-        ch_id = ch_opts.ch_id
-        label = ch_opts.label
-        metal = ch_opts.metal
-        ch = mcd.get_data(ac_id, ch_int=ch_id)
-        m = np.max(ch)
-        if m > 1e5:
-            logger.warn(f"Channel {acid}/{ch_id}:{label}:{metal} maximum value is {m}")
-        else:
-            logger.debug(f"Channel {ch_id}:{label}:{metal} maximum value: {m}")
+def save_stage_output(mcd, options, journal, output_type, suffix):
+    # outputs are only journaled once the whole save call succeeded, so an
+    # interrupted save is simply redone for every acquisition it covered
+    step = f"{journal.stage}-output"
+    acquisitions = dict(
+        (ac_id, channel_list)
+        for ac_id, channel_list in options.export_acquisitions().items()
+        if not journal.is_done(step, ac_id)
+    )
+    if not acquisitions:
+        logger.info("All results were already saved by a previous run.")
+        return
+
+    for ac_id in acquisitions:
+        journal.restore(mcd, ac_id, journal.stage)
+    mcd.save(acquisitions, output_type, prefix=options.output_prefix, suffix=suffix)
+    for ac_id in acquisitions:
+        journal.record(step, ac_id)
 
 
-def run_compensation(mcd, options):
+def run_compensation(mcd, options, journal, qc):
     logger.info("Running compensation")
+    journal.begin("compensate")
     logger.debug(
         "Note that all channels of the aquisition to be utilized during the "
         "compensation calculation but only those specified in the config "
@@ -113,28 +113,54 @@ def run_compensation(mcd, options):
     spillmat_raw = load_spillmat(options.spillover_matrix_file)
 
     for ac_options in options.acquisitions:
-        report_maxima(mcd, ac_options)
         ac_id = ac_options.acquisition_id
+        if journal.is_done(journal.stage, ac_id):
+            logger.info(f". acquisition {ac_id} already compensated.")
+            continue
+        journal.restore(mcd, ac_id, journal.previous_stage)
         logger.debug(f". compensating acquisition {ac_id}.")
-        spillmat = align_spillmat(spillmat_raw, mcd.channel_metals[ac_id])
+        metals = mcd.channel_metals[ac_id]
+        spillmat = align_spillmat(spillmat_raw, metals)
         uncomp = mcd.get_data(ac_id)
-        comp = compensate(uncomp, spillmat.values)
+        inverse = invert_spillmat(spillmat_raw, metals)
+        comp = compensate(uncomp, spillmat, inverse=inverse)
+
+        rows = []
+        for ch_opts in ac_options.channels:
+            raw, corrected = uncomp[ch_opts.ch_id], comp[ch_opts.ch_id]
+            raw_total = float(raw.sum(dtype=float))
+            correction = float(np.abs(raw.astype(float) - corrected).sum())
+            rows.append(
+                qc.observe(
+                    journal.stage,
+                    ac_id,
+                    ch_opts,
+                    corrected,
+                    input_maximum=float(raw.max()),
+                    input_saturated_fraction=float(
+                        np.count_nonzero(raw >= SATURATION_VALUE) / raw.size
+                    ),
+                    spillover_correction=correction / raw_total if raw_total else 0.0,
+                )
+            )
+
         mcd.set_data(comp, ac_id)
+        journal.complete(mcd, ac_id, qc=rows)
 
     if options.compensate_output_type:
         logger.info("Saving compensation results.")
-        acquisitions = options.export_acquisitions()
-        mcd.save(
-            acquisitions,
+        save_stage_output(
+            mcd,
+            options,
+            journal,
             options.compensate_output_type,
-            prefix=options.output_prefix,
-            suffix=options.compensate_output_suffix,
+            options.compensate_output_suffix,
         )
 
     logger.info("Compensation complete.")
 
 
-def run_pixel_removal(mcd, options):
+def run_pixel_removal(mcd, options, journal, qc):
     logger.info("Running pixel removal")
 
     method = options.pixel_removal_method
@@ -146,6 +172,7 @@ def run_pixel_removal(mcd, options):
         logger.warn("Proceeding without pixel removal!")
         return
     method_func = pixel_removal_functions[method]
+    journal.begin("pixel_removal")
 
     global_threshold, global_selem = None, None
     if options.global_pixel_removal_neighbors is not None:
@@ -156,12 +183,17 @@ def run_pixel_removal(mcd, options):
         logger.debug("Will use global pixel removal selem")
 
     for ac_options in options.acquisitions:
-        report_maxima(mcd, ac_options)
         ac_id = ac_options.acquisition_id
+        if journal.is_done(journal.stage, ac_id):
+            logger.info(f". acquisition {ac_id} already cleaned.")
+            continue
+        journal.restore(mcd, ac_id, journal.previous_stage)
 
+        rows = []
         for ch_opts in ac_options.channels:
             ch_id = ch_opts.ch_id
             clean = mcd.get_data(ac_id, ch_int=ch_id)
+            nonzero_before = np.count_nonzero(clean)
 
             logger.debug(f". cleaning acquisition/channel {ac_id}/{ch_opts.metal}.")
             selem = (
@@ -182,54 +214,94 @@ def run_pixel_removal(mcd, options):
                 )
                 clean = method_func(clean, **params)
 
+            pixels_removed = int(nonzero_before - np.count_nonzero(clean))
+            rows.append(
+                qc.observe(
+                    journal.stage, ac_id, ch_opts, clean, pixels_removed=pixels_removed
+                )
+            )
             mcd.set_data(clean, ac_id, ch_int=ch_id)
 
+        journal.complete(mcd, ac_id, qc=rows)
+
     if options.pixel_removal_output_type:
         logger.info("Saving pixel removal results.")
-        acquisitions = options.export_acquisitions()
-        mcd.save(
-            acquisitions,
+        save_stage_output(
+            mcd,
+            options,
+            journal,
             options.pixel_removal_output_type,
-            prefix=options.output_prefix,
-            suffix=options.pixel_removal_output_suffix,
+            options.pixel_removal_output_suffix,
         )
 
     logger.info("Pixel removal complete.")
 
 
-def run_equalization(mcd, options):
+def run_equalization(mcd, options, journal, qc):
     logger.info("Running equalization")
+    journal.begin("equalization")
 
     for ac_options in options.acquisitions:
-        report_maxima(mcd, ac_options)
         ac_id = ac_options.acquisition_id
+        if journal.is_done(journal.stage, ac_id):
+            logger.info(f". acquisition {ac_id} already equalized.")
+            continue
+        journal.restore(mcd, ac_id, journal.previous_stage)
         logger.debug(f". equalizing acquisition {ac_id}.")
         unequalized = mcd.get_data(ac_id)
         equalized = equalize(unequalized, adaptive=False)
+        rows = [
+            qc.observe(journal.stage, ac_id, ch_opts, equalized[ch_opts.ch_id])
+            for ch_opts in ac_options.channels
+        ]
         mcd.set_data(equalized, ac_id)
+        journal.complete(mcd, ac_id, qc=rows)
 
     if options.equalization_output_type:
         logger.info("Saving equalization results.")
-        acquisitions = options.export_acquisitions()
-        mcd.save(
-            acquisitions,
+        save_stage_output(
+            mcd,
+            options,
+            journal,
             options.equalization_output_type,
-            prefix=options.output_prefix,
-            suffix=options.equalization_output_suffix,
+            options.equalization_output_suffix,
         )
 
     logger.info("Equalization complete.")
 
 
-def process(options):
+def process(options, resume=False):
+    # fail before any processing if an output writer cannot run
+    for output_type in (
+        options.compensate_output_type,
+        options.pixel_removal_output_type,
+        options.equalization_output_type,
+    ):
+        if output_type:
+            check_output_format(output_type)
+
     mcd = MCD(options.mcdpath)
     mcd.load_mcd()
 
+    journal = RunJournal(
+        f"{options.output_prefix}.checkpoints",
+        fingerprint=options_fingerprint(options),
+        resume=resume,
+    )
+    qc = QCCollector()
+    for entry in journal.completed.values():
+        qc.extend(entry.get("qc", []))
+
     if options.do_compensate:
-        run_compensation(mcd, options)
+        run_compensation(mcd, options, journal, qc)
 
     if options.do_pixel_removal:
-        run_pixel_removal(mcd, options)
+        run_pixel_removal(mcd, options, journal, qc)
 
     if options.do_equalization:
-        run_equalization(mcd, options)
+        run_equalization(mcd, options, journal, qc)
+
+    if options.qc_output_type:
+        qc.save(options.qc_output_type, options.output_prefix, options.qc_output_suffix)
+
+    journal.finish()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from .logger import logger
+from .checkpoint import atomic_path
+
+SATURATION_VALUE = 2 ** 16 - 1
+MAXIMUM_WARNING = 1e5
+
+
+def channel_stats(ch):
+    n = ch.size
+    return dict(
+        maximum=float(ch.max()),
+        nonzero_fraction=float(np.count_nonzero(ch) / n),
+        saturated_fraction=float(np.count_nonzero(ch >= SATURATION_VALUE) / n),
+    )
+
+
+class QCCollector:
+    def __init__(self):
+        self.rows = []
+
+    def observe(self, stage, ac_id, ch_opts, ch, **extra):
+        row = dict(
+            stage=stage,
+            acquisition=str(ac_id),
+            channel=ch_opts.ch_id,
+            metal=ch_opts.metal,
+            label=ch_opts.label,
+            **channel_stats(ch),
+            **extra,
+        )
+        m = row["maximum"]
+        if m > MAXIMUM_WARNING:
+            logger.warn(
+                f"Channel {ac_id}/{ch_opts.ch_id}:{ch_opts.label}:{ch_opts.metal} "
+                f"maximum value after {stage} is {m}"
+            )
+        else:
+            logger.debug(
+                f"Channel {ch_opts.ch_id}:{ch_opts.label}:{ch_opts.metal} "
+                f"maximum value after {stage}: {m}"
+            )
+        self.rows.append(row)
+        return row
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+
+    def to_frame(self):
+        return pd.DataFrame(self.rows)
+
+    def save(self, output_type, prefix, suffix):
+        outfile = f"{prefix}{suffix}.{output_type}"
+        logger.info(f"Saving QC statistics to {outfile}")
+        table = self.to_frame()
+        with atomic_path(outfile) as tmp:
+            if output_type == "parquet":
+                table.to_parquet(tmp, index=False)
+            else:
+                table.to_csv(tmp, index=False)
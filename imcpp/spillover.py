@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import csv
+import functools
 from pathlib import Path
+from dataclasses import dataclass
 import numpy as np
-import pandas as pd
 
 import importlib.resources as import_res
 
@@ -11,17 +13,70 @@ with import_res.path("imcpp.data", "spillover.csv") as spillpath:
     SPILLMAT_CSV = spillpath
 
 
+@dataclass(frozen=True, eq=False)
+class SpillMatrix:
+    values: np.ndarray
+    row_index: dict
+    col_index: dict
+
+
+def _read_spillmat_csv(infile):
+    with open(infile, "r", newline="") as fin:
+        reader = csv.reader(fin)
+        columns = next(reader)[1:]
+        rows, values = [], []
+        for line in reader:
+            if not line:
+                continue
+            rows.append(line[0])
+            values.append([float(v) if v.strip() else np.nan for v in line[1:]])
+    values = np.array(values, dtype=float).reshape(len(rows), len(columns))
+    values.setflags(write=False)
+    return SpillMatrix(
+        values=values,
+        row_index={m: k for k, m in enumerate(rows)},
+        col_index={m: k for k, m in enumerate(columns)},
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _load_spillmat_cached(infile):
+    return _read_spillmat_csv(infile)
+
+
 def load_spillmat(infile=None):
     if not infile:
         infile = SPILLMAT_CSV
-    return pd.read_csv(infile, index_col=0)
+    return _load_spillmat_cached(str(Path(infile).resolve()))
+
+
+@functools.lru_cache(maxsize=None)
+def _align_spillmat_cached(spillmat, input_metals):
+    rows = np.array([spillmat.row_index.get(m, -1) for m in input_metals], dtype=int)
+    cols = np.array([spillmat.col_index.get(m, -1) for m in input_metals], dtype=int)
+    has_row, has_col = rows >= 0, cols >= 0
+
+    n = len(input_metals)
+    aligned = np.zeros((n, n), dtype=float)
+    aligned[np.ix_(has_row, has_col)] = spillmat.values[
+        np.ix_(rows[has_row], cols[has_col])
+    ]
+    np.fill_diagonal(aligned, 1.0)
+    aligned.setflags(write=False)
+    return aligned
 
 
 def align_spillmat(spillmat, input_metals):
+    return _align_spillmat_cached(spillmat, tuple(input_metals))
+
+
+@functools.lru_cache(maxsize=None)
+def _invert_spillmat_cached(spillmat, input_metals):
+    inverse = np.linalg.inv(_align_spillmat_cached(spillmat, input_metals).T)
+    inverse.setflags(write=False)
+    return inverse
 
-    unique_metals = set(spillmat.index.union(spillmat.columns))
 
-    sm = spillmat.reindex(index=input_metals, columns=input_metals, fill_value=0)
-    filled = sm.values
-    np.fill_diagonal(filled, 1.0)
-    return pd.DataFrame(filled, index=sm.index, columns=sm.columns)
+def invert_spillmat(spillmat, input_metals):
+    # compensate multiplies by inv(spillmat.T); cache it alongside the alignment
+    return _invert_spillmat_cached(spillmat, tuple(input_metals))
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from imcpp import processing
+from imcpp.checkpoint import RunJournal
+from imcpp.config import Acquisition, Channel, ProcessingOptions
+
+METALS = ["Dy161", "Dy162", "Dy163"]
+AC_IDS = ["1", "2", "3"]
+
+
+class FakeMCD:
+    def __init__(self, mcdpath):
+        self.mcdpath = mcdpath
+
+    def load_mcd(self):
+        rng = np.random.default_rng(0)
+        self.channel_metals = dict((ac_id, METALS) for ac_id in AC_IDS)
+        self.data = dict(
+            (ac_id, rng.integers(0, 50, size=(len(METALS), 32, 32)).astype(np.float32))
+            for ac_id in AC_IDS
+        )
+
+    def get_data(self, ac_id, ch_int=None):
+        if ch_int is not None:
+            return self.data[ac_id][ch_int]
+        return self.data[ac_id]
+
+    def set_data(self, new_data, ac_id, ch_int=None):
+        if ch_int is not None:
+            self.data[ac_id][ch_int] = new_data
+        else:
+            self.data[ac_id][:] = new_data
+
+    def save(self, acquisitions, output_format, prefix="", suffix=""):
+        for ac_id, channel_list in acquisitions.items():
+            ch_ids = [ch_id for ch_id, _, _ in channel_list]
+            np.save(f"{prefix}{suffix}.a{ac_id}.npy", self.get_data(ac_id)[ch_ids])
+
+
+def make_options(outdir):
+    acquisitions = [
+        Acquisition(
+            acquisition_id=ac_id,
+            channels=[Channel(k, metal, f"label{k}") for k, metal in enumerate(METALS)],
+        )
+        for ac_id in AC_IDS
+    ]
+    return ProcessingOptions(
+        mcdpath="fake.mcd",
+        output_prefix=str(outdir / "run"),
+        acquisitions=acquisitions,
+        compensate_output_type="tiff",
+        pixel_removal_output_type="tiff",
+        equalization_output_type="tiff",
+    )
+
+
+def read_outputs(outdir):
+    return dict((p.name, np.load(p)) for p in sorted(outdir.glob("*.npy")))
+
+
+def read_qc(outdir):
+    qc = pd.read_csv(outdir / "run-qc.csv")
+    return qc.sort_values(["stage", "acquisition", "channel"]).reset_index(drop=True)
+
+
+@pytest.fixture
+def fake_mcd(monkeypatch):
+    monkeypatch.setattr(processing, "MCD", FakeMCD)
+
+
+def test_resume_matches_clean_run(tmp_path, monkeypatch, fake_mcd):
+    clean_dir = tmp_path / "clean"
+    clean_dir.mkdir()
+    processing.process(make_options(clean_dir))
+
+    resumed_dir = tmp_path / "resumed"
+    resumed_dir.mkdir()
+    options = make_options(resumed_dir)
+
+    equalize = processing.equalize
+    calls = []
+
+    def interrupted_equalize(img_stack, adaptive=False):
+        # pre-empted while equalizing the second acquisition
+        calls.append(1)
+        if len(calls) == 2 and not resumed:
+            raise RuntimeError("pre-empted")
+        return equalize(img_stack, adaptive=adaptive)
+
+    resumed = False
+
+    monkeypatch.setattr(processing, "equalize", interrupted_equalize)
+    with pytest.raises(RuntimeError):
+        processing.process(options)
+    assert (resumed_dir / "run.checkpoints" / "journal.jsonl").exists()
+
+    compensate = processing.compensate
+    compensated = []
+
+    def counting_compensate(*args, **kwargs):
+        compensated.append(1)
+        return compensate(*args, **kwargs)
+
+    monkeypatch.setattr(processing, "compensate", counting_compensate)
+    resumed = True
+    del calls[:]
+    processing.process(options, resume=True)
+
+    # only the acquisitions that were not equalized yet are processed again
+    assert not compensated
+    assert len(calls) == len(AC_IDS) - 1
+    assert not (resumed_dir / "run.checkpoints").exists()
+
+    clean, resumed = read_outputs(clean_dir), read_outputs(resumed_dir)
+    assert clean.keys() == resumed.keys()
+    assert len(clean) == 3 * len(AC_IDS)
+    for name in clean:
+        np.testing.assert_array_equal(clean[name], resumed[name])
+
+    pd.testing.assert_frame_equal(read_qc(clean_dir), read_qc(resumed_dir))
+
+
+def test_without_resume_starts_over(tmp_path, monkeypatch, fake_mcd):
+    options = make_options(tmp_path)
+
+    def failing_equalize(img_stack, adaptive=False):
+        raise RuntimeError("pre-empted")
+
+    monkeypatch.setattr(processing, "equalize", failing_equalize)
+    with pytest.raises(RuntimeError):
+        processing.process(options)
+    monkeypatch.undo()
+    monkeypatch.setattr(processing, "MCD", FakeMCD)
+
+    compensate = processing.compensate
+    compensated = []
+
+    def counting_compensate(*args, **kwargs):
+        compensated.append(1)
+        return compensate(*args, **kwargs)
+
+    monkeypatch.setattr(processing, "compensate", counting_compensate)
+    processing.process(options)
+    assert len(compensated) == len(AC_IDS)
+
+
+def test_torn_journal_line_is_dropped(tmp_path):
+    journal = RunJournal(tmp_path / "checkpoints", fingerprint="x")
+    journal.record("compensate", "1")
+    with open(journal.path, "a") as fout:
+        fout.write('{"stage": "compens')
+
+    journal = RunJournal(tmp_path / "checkpoints", fingerprint="x", resume=True)
+    journal.record("compensate", "2")
+
+    journal = RunJournal(tmp_path / "checkpoints", fingerprint="x", resume=True)
+    assert journal.is_done("compensate", "1")
+    assert journal.is_done("compensate", "2")
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from imcpp.spillover import (
+    SPILLMAT_CSV,
+    align_spillmat,
+    invert_spillmat,
+    load_spillmat,
+)
+
+
+def reference_align(infile, input_metals):
+    # the original pandas implementation
+    spillmat = pd.read_csv(infile, index_col=0)
+    sm = spillmat.reindex(index=input_metals, columns=input_metals, fill_value=0)
+    filled = sm.values.copy()
+    np.fill_diagonal(filled, 1.0)
+    return filled
+
+
+@pytest.mark.parametrize(
+    "metals",
+    [
+        ["Dy161", "Dy162", "Dy163", "Dy164"],
+        ["Dy164", "Dy161", "Er166", "Yb171"],
+        ["Ir191", "Dy161", "Xx999", "Dy162", "Ir193"],
+        ["Xx998", "Xx999"],
+    ],
+)
+def test_align_matches_reindex(metals):
+    spillmat = load_spillmat()
+    expected = reference_align(SPILLMAT_CSV, metals)
+    np.testing.assert_array_equal(align_spillmat(spillmat, metals), expected)
+    np.testing.assert_allclose(
+        invert_spillmat(spillmat, metals), np.linalg.inv(expected.T)
+    )
+
+
+def test_custom_spillmat_file(tmp_path):
+    infile = tmp_path / "spill.csv"
+    infile.write_text(",A,B,C\nA,1,0.1,0.2\nC,0.3,0,1\n")
+    metals = ["C", "B", "A", "D"]
+    np.testing.assert_array_equal(
+        align_spillmat(load_spillmat(infile), metals), reference_align(infile, metals)
+    )
+
+
+def test_results_are_cached():
+    spillmat = load_spillmat()
+    assert load_spillmat() is spillmat
+    metals = ["Dy161", "Dy162"]
+    assert align_spillmat(spillmat, metals) is align_spillmat(spillmat, tuple(metals))
+    assert invert_spillmat(spillmat, metals) is invert_spillmat(spillmat, metals)